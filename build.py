@@ -8,13 +8,29 @@ Weekly change is calculated directly from ~7 trading days of
 yfinance historical data (true week-over-week comparison).
 """
 
+import argparse
+import heapq
 import json
-import shutil
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 
-import yfinance as yf
-from jinja2 import Environment, FileSystemLoader
+import numpy as np
+
+from site_common import (
+    STATIC_DIR,
+    dump_json,
+    format_market_cap,
+    format_price,
+    stream_template,
+    sync_tree,
+)
+from yahoo import (
+    fetch_quotes,
+    load_static_fundamentals,
+    save_cache,
+    sparkline_from_download,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -22,11 +38,13 @@ from jinja2 import Environment, FileSystemLoader
 
 PROJECT_ROOT = Path(__file__).parent
 DATA_DIR = PROJECT_ROOT / "data"
-TEMPLATE_DIR = PROJECT_ROOT / "templates"
-STATIC_DIR = PROJECT_ROOT / "static"
 OUTPUT_DIR = PROJECT_ROOT / "docs"
 PRICE_HISTORY_FILE = DATA_DIR / "price_history.json"
 
+# Window for the week-over-week change, in calendar days
+# (~10 days to ensure 7 trading days of history)
+CHANGE_WINDOW_DAYS = 10
+
 # ---------------------------------------------------------------------------
 # Anchor companies — must be present for build integrity
 # These are SoCal's largest public companies by market cap.
@@ -77,13 +95,12 @@ def save_price_history(prices, build_date):
         "saved_at": build_date.isoformat(),
         "prices": prices,
     }
-    with open(PRICE_HISTORY_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    PRICE_HISTORY_FILE.write_bytes(dump_json(data, indent=True))
     print(f"  Saved prices for {len(prices)} tickers → {PRICE_HISTORY_FILE.name}")
 
 
 # ---------------------------------------------------------------------------
-# Data fetching (using yfinance — free, no API key)
+# Data fetching
 # ---------------------------------------------------------------------------
 
 
@@ -93,73 +110,6 @@ def load_companies():
         return json.load(f)
 
 
-def fetch_quotes(tickers):
-    """
-    Fetch quotes for all tickers using yfinance.
-    yfinance can fetch multiple tickers at once efficiently.
-    Returns list of quote dicts with both current and week-ago prices.
-    """
-    print(f"  Downloading data for {len(tickers)} tickers...")
-
-    # yfinance can handle multiple tickers in one call
-    # Use 10 days to ensure we capture at least 7 trading days
-    tickers_str = " ".join(tickers)
-    data = yf.download(
-        tickers_str,
-        period="10d",  # Get ~10 days to ensure 7 trading days of history
-        group_by="ticker",
-        progress=False,
-        threads=True,
-    )
-
-    # Also get info for each ticker (P/E, market cap, etc.)
-    all_quotes = []
-    failed = []
-
-    for ticker in tickers:
-        try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-
-            # Get current and week-ago prices from the download data
-            if len(tickers) == 1:
-                # Single ticker: data is not nested
-                current_price = float(data["Close"].iloc[-1])
-                week_ago_price = float(data["Close"].iloc[0])
-            else:
-                # Multiple tickers: data is nested by ticker
-                if ticker in data.columns.get_level_values(0):
-                    ticker_data = data[ticker]["Close"].dropna()
-                    if len(ticker_data) >= 2:
-                        current_price = float(ticker_data.iloc[-1])
-                        week_ago_price = float(ticker_data.iloc[0])
-                    else:
-                        current_price = info.get("currentPrice") or info.get("regularMarketPrice", 0)
-                        week_ago_price = None
-                else:
-                    current_price = info.get("currentPrice") or info.get("regularMarketPrice", 0)
-                    week_ago_price = None
-
-            if current_price and current_price > 0:
-                all_quotes.append({
-                    "symbol": ticker,
-                    "price": current_price,
-                    "week_ago_price": week_ago_price,
-                    "yearHigh": info.get("fiftyTwoWeekHigh", 0),
-                    "yearLow": info.get("fiftyTwoWeekLow", 0),
-                    "marketCap": info.get("marketCap", 0),
-                    "pe": info.get("trailingPE"),
-                    "volume": info.get("volume", 0),
-                })
-        except Exception as e:
-            failed.append(ticker)
-
-    if failed:
-        print(f"  Warning: Failed to fetch {len(failed)} tickers: {', '.join(failed[:5])}{'...' if len(failed) > 5 else ''}")
-
-    return all_quotes
-
-
 def validate_anchor_companies(quotes):
     """
     Check that all anchor companies were successfully fetched.
@@ -189,187 +139,165 @@ def validate_anchor_companies(quotes):
     return [t for t, n in missing]
 
 
-def fetch_historical(ticker, days=7):
-    """
-    Fetch recent daily closing prices for sparkline charts.
-    Returns a list of floats (oldest → newest).
-    """
-    try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="7d")
-        if not hist.empty:
-            prices = hist["Close"].tolist()
-            return [round(p, 2) for p in prices]
-    except Exception as e:
-        print(f"    Warning: Failed to fetch history for {ticker}: {e}")
-    return []
-
-
 # ---------------------------------------------------------------------------
 # Data processing
 # ---------------------------------------------------------------------------
 
 
+@dataclass(slots=True)
+class StockRow:
+    """One company's enriched data, as shown on the site."""
+    rank: int
+    name: str
+    ticker: str
+    city: str
+    price: float
+    change_pct: float
+    year_high: float
+    year_low: float
+    market_cap: float
+    pe: float | None
+    volume: int
+    year_change: float = 0
+    # Display strings, filled in by add_display_fields
+    price_fmt: str = ""
+    market_cap_fmt: str = ""
+
+
 def build_rankings(companies, quotes):
     """
     Merge company info with quote data.
     Calculate week-over-week change directly from yfinance historical data.
-    Return sorted gainers (top 25), losers (bottom 25), and all enriched data.
+    Returns all enriched data (in quote order) and current prices.
     """
     # Build a lookup from ticker → company metadata
     company_map = {c["ticker"]: c for c in companies}
 
+    rows = [q for q in quotes if q.get("symbol", "") in company_map]
+
+    # Week-over-week change for all rows at once, directly from yfinance
+    # historical data (0 when no week-ago price is available)
+    current = np.array([q.get("price", 0) or 0 for q in rows], dtype=np.float64)
+    week_ago = np.array([q.get("week_ago_price") or 0 for q in rows], dtype=np.float64)
+    has_history = week_ago > 0
+    safe_week_ago = np.where(has_history, week_ago, 1.0)
+    change = np.where(has_history, (current - week_ago) / safe_week_ago * 100, 0.0)
+    change = np.round(change, 2)
+
     enriched = []
     current_prices = {}  # To save for reference/debugging
 
-    for q in quotes:
-        ticker = q.get("symbol", "")
-        if ticker not in company_map:
-            continue
-
+    for q, week_change, ok in zip(rows, change.tolist(), has_history.tolist()):
+        ticker = q["symbol"]
         meta = company_map[ticker]
         current_price = q.get("price", 0) or 0
-        week_ago_price = q.get("week_ago_price")
         current_prices[ticker] = current_price
 
-        # Calculate week-over-week change directly from yfinance historical data
-        if week_ago_price and week_ago_price > 0:
-            week_change = ((current_price - week_ago_price) / week_ago_price) * 100
-        else:
-            # Fallback: no historical data available
-            week_change = 0
-
         enriched.append(
-            {
-                "rank": 0,
-                "name": meta["name"],
-                "ticker": ticker,
-                "city": meta["city"],
-                "price": current_price,
-                "change_pct": round(week_change, 2),
-                "year_high": q.get("yearHigh", 0),
-                "year_low": q.get("yearLow", 0),
-                "market_cap": q.get("marketCap", 0),
-                "pe": q.get("pe"),
-                "volume": q.get("volume", 0),
-            }
+            StockRow(
+                rank=0,
+                name=meta["name"],
+                ticker=ticker,
+                city=meta["city"],
+                price=current_price,
+                change_pct=week_change if ok else 0,
+                year_high=q.get("yearHigh", 0),
+                year_low=q.get("yearLow", 0),
+                market_cap=q.get("marketCap", 0),
+                pe=q.get("pe"),
+                volume=q.get("volume", 0),
+            )
         )
 
-    # Sort by weekly change %
-    enriched.sort(key=lambda x: x["change_pct"], reverse=True)
-
-    # Top 25 gainers
-    gainers = enriched[:25]
-    for i, g in enumerate(gainers, 1):
-        g["rank"] = i
-
-    # Bottom 25 losers (worst first)
-    losers = sorted(enriched, key=lambda x: x["change_pct"])[:25]
-    for i, l in enumerate(losers, 1):
-        l["rank"] = i
-
-    return gainers, losers, enriched, current_prices
+    return enriched, current_prices
 
 
-def compute_pe_extremes(enriched):
-    """Find the 3 highest and 3 lowest P/E ratios (excluding None/0)."""
-    with_pe = [s for s in enriched if s["pe"] and s["pe"] > 0]
-    with_pe.sort(key=lambda x: x["pe"], reverse=True)
-    highest = with_pe[:3]
-    lowest = with_pe[-3:]
-    return highest, lowest
-
-
-def get_initials(name):
-    """Get 1-2 character initials for avatar display."""
-    words = name.replace(".", "").split()
-    if len(words) >= 2:
-        return (words[0][0] + words[1][0]).upper()
-    return name[:2].upper()
-
-
-def format_market_cap(value):
-    """Format market cap as human-readable string."""
-    if not value:
-        return "N/A"
-    if value >= 1_000_000_000_000:
-        return f"${value / 1_000_000_000_000:.1f}T"
-    if value >= 1_000_000_000:
-        return f"${value / 1_000_000_000:.1f}B"
-    if value >= 1_000_000:
-        return f"${value / 1_000_000:.0f}M"
-    return f"${value:,.0f}"
+def compute_all_extremes(enriched, n_movers=25, n_pe=3):
+    """
+    Find gainers, losers and P/E extremes.
+    Top 25 gainers and bottom 25 losers (worst first) get ranks assigned;
+    P/E lists are the 3 highest and 3 lowest (excluding None/0), each
+    highest-first. heapq.nlargest/nsmallest are stable, so ties come out
+    in the same order as the full sorts they replace.
+    """
+    with_pe = [s for s in enriched if s.pe and s.pe > 0]
+    extremes = {
+        "gainers": heapq.nlargest(n_movers, enriched, key=lambda x: x.change_pct),
+        "losers": heapq.nsmallest(n_movers, enriched, key=lambda x: x.change_pct),
+        "pe_highest": heapq.nlargest(n_pe, with_pe, key=lambda x: x.pe),
+        # Tail of the highest-first P/E sort, still highest-first
+        "pe_lowest": heapq.nsmallest(n_pe, reversed(with_pe), key=lambda x: x.pe)[::-1],
+    }
 
+    for i, g in enumerate(extremes["gainers"], 1):
+        g.rank = i
+    for i, l in enumerate(extremes["losers"], 1):
+        l.rank = i
 
-def format_price(value):
-    """Format price with 2 decimal places."""
-    if not value:
-        return "$0.00"
-    return f"${value:,.2f}"
+    return extremes
 
 
 def compute_52_week_change(stock):
     """Approximate 52-week change from year low to current price."""
-    if stock["year_low"] and stock["year_low"] > 0:
+    if stock.year_low and stock.year_low > 0:
         return round(
-            ((stock["price"] - stock["year_low"]) / stock["year_low"]) * 100, 1
+            ((stock.price - stock.year_low) / stock.year_low) * 100, 1
         )
     return 0
 
 
+def add_display_fields(stocks):
+    """
+    Precompute formatted price and market cap strings on each stock,
+    so templates read plain fields instead of calling filters per row.
+    """
+    for stock in stocks:
+        stock.price_fmt = format_price(stock.price)
+        stock.market_cap_fmt = format_market_cap(stock.market_cap)
+
+
 # ---------------------------------------------------------------------------
 # Template rendering
 # ---------------------------------------------------------------------------
 
 
 def render_site(gainers, losers, pe_highest, pe_lowest, spotlight_gainer,
-                spotlight_loser, gainer_sparkline, loser_sparkline, build_date):
-    """Render Jinja2 templates to static HTML in docs/."""
-
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-    env.filters["initials"] = get_initials
-    env.filters["market_cap"] = format_market_cap
-    env.filters["price"] = format_price
+                spotlight_loser, gainer_sparkline, loser_sparkline, build_date,
+                clean=False, output_dir=OUTPUT_DIR):
+    """Render Jinja2 templates to static HTML in output_dir (docs/ by default)."""
 
     common_context = {
         "build_date": build_date,
         "year": build_date.year,
     }
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     # --- Homepage ---
-    index_tmpl = env.get_template("index.html")
-    index_html = index_tmpl.render(
+    index_size = stream_template(
+        "index.html", output_dir / "index.html",
         spotlight_gainer=spotlight_gainer,
         spotlight_loser=spotlight_loser,
-        gainer_sparkline=json.dumps(gainer_sparkline),
-        loser_sparkline=json.dumps(loser_sparkline),
+        gainer_sparkline=dump_json(gainer_sparkline).decode("utf-8"),
+        loser_sparkline=dump_json(loser_sparkline).decode("utf-8"),
         pe_highest=pe_highest,
         pe_lowest=pe_lowest,
         **common_context,
     )
 
     # --- Rankings ---
-    rankings_tmpl = env.get_template("rankings.html")
-    rankings_html = rankings_tmpl.render(
+    rankings_size = stream_template(
+        "rankings.html", output_dir / "rankings.html",
         gainers=gainers,
         losers=losers,
         **common_context,
     )
 
-    # Write output
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    (OUTPUT_DIR / "index.html").write_text(index_html)
-    (OUTPUT_DIR / "rankings.html").write_text(rankings_html)
-
-    # Copy static assets
-    static_out = OUTPUT_DIR / "static"
-    if static_out.exists():
-        shutil.rmtree(static_out)
-    shutil.copytree(STATIC_DIR, static_out)
+    # Copy static assets (only files that changed)
+    sync_tree(STATIC_DIR, output_dir / "static", clean=clean)
 
-    print(f"✓ Site built → {OUTPUT_DIR}")
-    print(f"  index.html    ({len(index_html):,} bytes)")
-    print(f"  rankings.html ({len(rankings_html):,} bytes)")
+    print(f"✓ Site built → {output_dir}")
+    print(f"  index.html    ({index_size:,} bytes)")
+    print(f"  rankings.html ({rankings_size:,} bytes)")
 
 
 # ---------------------------------------------------------------------------
@@ -377,7 +305,11 @@ def render_site(gainers, losers, pe_highest, pe_lowest, spotlight_gainer,
 # ---------------------------------------------------------------------------
 
 
-def main():
+def build_site(data=None, output_dir=OUTPUT_DIR, clean=False):
+    """
+    Fetch, rank and render the SoCal site into output_dir.
+    Pass data (a download_prices() frame) to skip the price download.
+    """
     print("LA Stock Watch — Building site with live data")
     print("=" * 50)
 
@@ -386,7 +318,9 @@ def main():
 
     print(f"\nFetching market data for {len(tickers)} companies...")
     print("  (Weekly change calculated from ~7 trading days of yfinance data)")
-    quotes = fetch_quotes(tickers)
+    quotes, _, price_data = fetch_quotes(
+        tickers, CHANGE_WINDOW_DAYS, load_static_fundamentals(companies), data
+    )
     print(f"  Got quotes for {len(quotes)} companies")
 
     # Validate that anchor companies were fetched
@@ -396,29 +330,31 @@ def main():
         print("\n⚠ Too few quotes fetched. Check network connection.")
         return
 
-    gainers, losers, enriched, current_prices = build_rankings(companies, quotes)
-    pe_highest, pe_lowest = compute_pe_extremes(enriched)
+    enriched, current_prices = build_rankings(companies, quotes)
+    extremes = compute_all_extremes(enriched)
+    gainers, losers = extremes["gainers"], extremes["losers"]
+    pe_highest, pe_lowest = extremes["pe_highest"], extremes["pe_lowest"]
 
     # Add 52-week change to all stocks
     for stock in gainers + losers:
-        stock["year_change"] = compute_52_week_change(stock)
+        stock.year_change = compute_52_week_change(stock)
+    add_display_fields(enriched)
 
     # Spotlight: top gainer and top loser
     spotlight_gainer = gainers[0] if gainers else None
     spotlight_loser = losers[0] if losers else None
 
-    print(f"\n  Top gainer: {spotlight_gainer['name']} ({spotlight_gainer['ticker']}) +{spotlight_gainer['change_pct']}%")
-    print(f"  Top loser:  {spotlight_loser['name']} ({spotlight_loser['ticker']}) {spotlight_loser['change_pct']}%")
+    print(f"\n  Top gainer: {spotlight_gainer.name} ({spotlight_gainer.ticker}) +{spotlight_gainer.change_pct}%")
+    print(f"  Top loser:  {spotlight_loser.name} ({spotlight_loser.ticker}) {spotlight_loser.change_pct}%")
 
-    # Fetch sparkline data (7-day price history for the chart)
+    # Sparkline data (7-day price history for the chart), from the download
     gainer_sparkline = []
     loser_sparkline = []
     if spotlight_gainer:
-        print(f"\n  Fetching sparkline for {spotlight_gainer['ticker']}...")
-        gainer_sparkline = fetch_historical(spotlight_gainer["ticker"])
+        gainer_sparkline = sparkline_from_download(price_data, spotlight_gainer.ticker)
     if spotlight_loser:
-        print(f"  Fetching sparkline for {spotlight_loser['ticker']}...")
-        loser_sparkline = fetch_historical(spotlight_loser["ticker"])
+        loser_sparkline = sparkline_from_download(price_data, spotlight_loser.ticker)
+    save_cache()
 
     build_date = datetime.now(timezone.utc)
 
@@ -431,9 +367,17 @@ def main():
         gainers, losers, pe_highest, pe_lowest,
         spotlight_gainer, spotlight_loser,
         gainer_sparkline, loser_sparkline,
-        build_date,
+        build_date, clean=clean, output_dir=output_dir,
     )
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Build the LA Stock Watch site.")
+    parser.add_argument("--clean", action="store_true",
+                        help="recopy static assets from scratch")
+    args = parser.parse_args()
+    build_site(clean=args.clean)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,53 @@
+"""
+LA Stock Watch — Combined Build
+Builds both sites from a single Yahoo Finance download:
+  - SoCal weekly movers → docs/full/
+  - Top 25              → docs/
+
+The SoCal and Top 25 lists mostly overlap (SWKS and TTEK are Top 25 only),
+so running build.py and build_top25.py back to back downloads most prices
+twice. Here the union of both lists is downloaded once and shared.
+
+For local use: the GitHub Actions workflows still run build.py (weekly)
+and build_top25.py (daily) separately, since the two sites are published
+on different schedules.
+"""
+
+import argparse
+
+import build
+import build_top25
+import yahoo
+
+SOCAL_OUTPUT_DIR = build.OUTPUT_DIR / "full"
+TOP25_OUTPUT_DIR = build_top25.OUTPUT_DIR
+
+
+def load_all_tickers():
+    """Union of the SoCal and Top 25 ticker lists, in a stable order."""
+    companies = build.load_companies() + build_top25.load_companies()
+    return sorted({c["ticker"] for c in companies})
+
+
+def build_all(clean=False):
+    """Download prices once, then build both sites from the shared frame."""
+    tickers = load_all_tickers()
+    print(f"Downloading data for {len(tickers)} tickers (both sites)...")
+    data = yahoo.download_prices(tickers)
+
+    print()
+    build.build_site(data=data, output_dir=SOCAL_OUTPUT_DIR, clean=clean)
+    print()
+    build_top25.build_site(data=data, output_dir=TOP25_OUTPUT_DIR, clean=clean)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build both LA Stock Watch sites.")
+    parser.add_argument("--clean", action="store_true",
+                        help="recopy static assets from scratch")
+    args = parser.parse_args()
+    build_all(clean=args.clean)
+
+
+if __name__ == "__main__":
+    main()
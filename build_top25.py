@@ -8,13 +8,27 @@ Generates:
   - docs-top25/verification.txt (validation log)
 """
 
+import argparse
 import json
-import shutil
+from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 
-import yfinance as yf
-from jinja2 import Environment, FileSystemLoader
+from site_common import (
+    STATIC_DIR,
+    dump_json,
+    format_market_cap,
+    format_pe,
+    format_price,
+    stream_template,
+    sync_tree,
+)
+from yahoo import (
+    fetch_quotes,
+    load_static_fundamentals,
+    save_cache,
+    sparkline_from_download,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -22,8 +36,6 @@ from jinja2 import Environment, FileSystemLoader
 
 PROJECT_ROOT = Path(__file__).parent
 DATA_DIR = PROJECT_ROOT / "data"
-TEMPLATE_DIR = PROJECT_ROOT / "templates"
-STATIC_DIR = PROJECT_ROOT / "static"
 OUTPUT_DIR = PROJECT_ROOT / "docs"
 
 # Validation thresholds
@@ -31,6 +43,9 @@ MIN_MARKET_CAP = 1_000_000_000      # $1B
 MAX_MARKET_CAP = 500_000_000_000    # $500B
 MAX_WEEKLY_CHANGE = 60              # ±60%
 
+# Window for the 7-day change, in calendar days
+CHANGE_WINDOW_DAYS = 7
+
 # ---------------------------------------------------------------------------
 # Data fetching
 # ---------------------------------------------------------------------------
@@ -42,86 +57,32 @@ def load_companies():
         return json.load(f)
 
 
-def fetch_quotes(tickers):
-    """
-    Fetch quotes for all tickers using yfinance.
-    Returns list of quote dicts with price, market cap, P/E, and weekly change.
-    """
-    print(f"  Fetching data for {len(tickers)} tickers...")
-
-    # Fetch 7 calendar days for true weekly comparison
-    tickers_str = " ".join(tickers)
-    data = yf.download(
-        tickers_str,
-        period="7d",
-        group_by="ticker",
-        progress=False,
-        threads=True,
-    )
-
-    all_quotes = []
-    failed = []
-
-    for ticker in tickers:
-        try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-
-            # Get current and week-ago prices from history
-            if len(tickers) == 1:
-                current_price = float(data["Close"].iloc[-1])
-                week_ago_price = float(data["Close"].iloc[0])
-            else:
-                if ticker in data.columns.get_level_values(0):
-                    ticker_data = data[ticker]["Close"].dropna()
-                    if len(ticker_data) >= 2:
-                        current_price = float(ticker_data.iloc[-1])
-                        week_ago_price = float(ticker_data.iloc[0])
-                    else:
-                        current_price = info.get("currentPrice") or info.get("regularMarketPrice", 0)
-                        week_ago_price = None
-                else:
-                    current_price = info.get("currentPrice") or info.get("regularMarketPrice", 0)
-                    week_ago_price = None
-
-            if current_price and current_price > 0:
-                all_quotes.append({
-                    "symbol": ticker,
-                    "price": current_price,
-                    "week_ago_price": week_ago_price,
-                    "yearHigh": info.get("fiftyTwoWeekHigh", 0),
-                    "yearLow": info.get("fiftyTwoWeekLow", 0),
-                    "marketCap": info.get("marketCap", 0),
-                    "pe": info.get("trailingPE"),
-                    "volume": info.get("volume", 0),
-                })
-        except Exception as e:
-            failed.append(ticker)
-
-    if failed:
-        print(f"  WARNING: Failed to fetch: {', '.join(failed)}")
-
-    return all_quotes, failed
-
-
-def fetch_historical(ticker, days=7):
-    """Fetch recent daily closing prices for sparkline charts."""
-    try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="7d")
-        if not hist.empty:
-            prices = hist["Close"].tolist()
-            return [round(p, 2) for p in prices]
-    except Exception:
-        pass
-    return []
-
-
 # ---------------------------------------------------------------------------
 # Data processing
 # ---------------------------------------------------------------------------
 
 
+@dataclass(slots=True)
+class StockRow:
+    """One company's enriched data, as shown on the site and in top25.json."""
+    rank: int
+    name: str
+    ticker: str
+    city: str
+    county: str
+    price: float
+    change_pct: float
+    year_high: float
+    year_low: float
+    market_cap: float
+    pe: float | None
+    yahoo_url: str
+    # Display strings, filled in by add_display_fields (not in top25.json)
+    price_fmt: str = ""
+    market_cap_fmt: str = ""
+    pe_fmt: str = ""
+
+
 def build_enriched_data(companies, quotes):
     """
     Merge company info with quote data.
@@ -146,46 +107,46 @@ def build_enriched_data(companies, quotes):
         else:
             week_change = 0
 
-        enriched.append({
-            "rank": 0,
-            "name": company["name"],
-            "ticker": ticker,
-            "city": company["city"],
-            "county": company["county"],
-            "price": current_price,
-            "change_pct": round(week_change, 2),
-            "year_high": q.get("yearHigh", 0),
-            "year_low": q.get("yearLow", 0),
-            "market_cap": q.get("marketCap", 0),
-            "pe": q.get("pe"),
-            "yahoo_url": f"https://finance.yahoo.com/quote/{ticker}/",
-        })
+        enriched.append(StockRow(
+            rank=0,
+            name=company["name"],
+            ticker=ticker,
+            city=company["city"],
+            county=company["county"],
+            price=current_price,
+            change_pct=round(week_change, 2),
+            year_high=q.get("yearHigh", 0),
+            year_low=q.get("yearLow", 0),
+            market_cap=q.get("marketCap", 0),
+            pe=q.get("pe"),
+            yahoo_url=f"https://finance.yahoo.com/quote/{ticker}/",
+        ))
 
     # Sort by market cap (descending)
-    enriched.sort(key=lambda x: x["market_cap"] or 0, reverse=True)
+    enriched.sort(key=lambda x: x.market_cap or 0, reverse=True)
 
     # Assign ranks
     for i, stock in enumerate(enriched, 1):
-        stock["rank"] = i
+        stock.rank = i
 
     return enriched
 
 
-def find_spotlight_stocks(enriched):
-    """Find the top gainer and top loser by 7-day change."""
-    sorted_by_change = sorted(enriched, key=lambda x: x["change_pct"], reverse=True)
-    gainer = sorted_by_change[0] if sorted_by_change else None
-    loser = sorted_by_change[-1] if sorted_by_change else None
-    return gainer, loser
-
-
-def compute_pe_extremes(enriched):
-    """Find highest and lowest P/E ratios."""
-    with_pe = [s for s in enriched if s["pe"] and s["pe"] > 0]
-    with_pe.sort(key=lambda x: x["pe"], reverse=True)
-    highest = with_pe[0] if with_pe else None
-    lowest = with_pe[-1] if with_pe else None
-    return highest, lowest
+def compute_all_extremes(enriched):
+    """
+    Find the top gainer and top loser by 7-day change and the highest and
+    lowest P/E ratios (excluding None/0).
+    Returns a dict; each entry is None when there is no candidate.
+    Ties resolve like the old sort-then-take-the-ends code: first of the
+    tied stocks for the top, last for the bottom.
+    """
+    with_pe = [s for s in enriched if s.pe and s.pe > 0]
+    return {
+        "gainer": max(enriched, key=lambda x: x.change_pct, default=None),
+        "loser": min(reversed(enriched), key=lambda x: x.change_pct, default=None),
+        "pe_highest": max(with_pe, key=lambda x: x.pe, default=None),
+        "pe_lowest": min(reversed(with_pe), key=lambda x: x.pe, default=None),
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -211,7 +172,7 @@ def validate_data(enriched, failed_tickers):
         passed = False
 
     # Check 2: All prices positive
-    prices = [s["price"] for s in enriched]
+    prices = [s.price for s in enriched]
     if all(p > 0 for p in prices):
         log.append(f"Price range: ${min(prices):.2f} - ${max(prices):.2f} OK")
     else:
@@ -219,7 +180,7 @@ def validate_data(enriched, failed_tickers):
         passed = False
 
     # Check 3: Market caps in expected range
-    caps = [s["market_cap"] for s in enriched if s["market_cap"]]
+    caps = [s.market_cap for s in enriched if s.market_cap]
     if caps:
         min_cap = min(caps)
         max_cap = max(caps)
@@ -230,10 +191,10 @@ def validate_data(enriched, failed_tickers):
             log.append(f"Market cap range: ${min_cap/1e9:.1f}B - ${max_cap/1e9:.1f}B WARNING (outside expected)")
 
     # Check 4: Flag extreme movers
-    extreme_movers = [s for s in enriched if abs(s["change_pct"]) > MAX_WEEKLY_CHANGE]
+    extreme_movers = [s for s in enriched if abs(s.change_pct) > MAX_WEEKLY_CHANGE]
     if extreme_movers:
         for s in extreme_movers:
-            log.append(f"Extreme mover: {s['ticker']} ({s['change_pct']:+.1f}%) - flagged for review")
+            log.append(f"Extreme mover: {s.ticker} ({s.change_pct:+.1f}%) - flagged for review")
     else:
         log.append("No extreme movers (within +/-60%)")
 
@@ -245,39 +206,15 @@ def validate_data(enriched, failed_tickers):
 # ---------------------------------------------------------------------------
 
 
-def get_initials(name):
-    """Get 1-2 character initials for avatar display."""
-    words = name.replace(".", "").split()
-    if len(words) >= 2:
-        return (words[0][0] + words[1][0]).upper()
-    return name[:2].upper()
-
-
-def format_market_cap(value):
-    """Format market cap as human-readable string."""
-    if not value:
-        return "N/A"
-    if value >= 1_000_000_000_000:
-        return f"${value / 1_000_000_000_000:.1f}T"
-    if value >= 1_000_000_000:
-        return f"${value / 1_000_000_000:.1f}B"
-    if value >= 1_000_000:
-        return f"${value / 1_000_000:.0f}M"
-    return f"${value:,.0f}"
-
-
-def format_price(value):
-    """Format price with 2 decimal places."""
-    if not value:
-        return "$0.00"
-    return f"${value:,.2f}"
-
-
-def format_pe(value):
-    """Format P/E ratio."""
-    if not value:
-        return "N/A"
-    return f"{value:.1f}x"
+def add_display_fields(stocks):
+    """
+    Precompute formatted price, market cap and P/E strings on each stock,
+    so templates read plain fields instead of calling filters per row.
+    """
+    for stock in stocks:
+        stock.price_fmt = format_price(stock.price)
+        stock.market_cap_fmt = format_market_cap(stock.market_cap)
+        stock.pe_fmt = format_pe(stock.pe)
 
 
 # ---------------------------------------------------------------------------
@@ -286,56 +223,48 @@ def format_pe(value):
 
 
 def render_site(enriched, gainer, loser, pe_high, pe_low,
-                gainer_sparkline, loser_sparkline, build_date, validation_log):
-    """Render the single-page site."""
+                gainer_sparkline, loser_sparkline, build_date, validation_log,
+                clean=False, output_dir=OUTPUT_DIR):
+    """Render the single-page site into output_dir (docs/ by default)."""
 
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-    env.filters["initials"] = get_initials
-    env.filters["market_cap"] = format_market_cap
-    env.filters["price"] = format_price
-    env.filters["pe"] = format_pe
+    # Ensure output directory exists
+    output_dir.mkdir(parents=True, exist_ok=True)
 
-    template = env.get_template("top25.html")
-    html = template.render(
+    html_size = stream_template(
+        "top25.html", output_dir / "index.html",
         companies=enriched,
         spotlight_gainer=gainer,
         spotlight_loser=loser,
         pe_highest=pe_high,
         pe_lowest=pe_low,
-        gainer_sparkline=json.dumps(gainer_sparkline),
-        loser_sparkline=json.dumps(loser_sparkline),
+        gainer_sparkline=dump_json(gainer_sparkline).decode("utf-8"),
+        loser_sparkline=dump_json(loser_sparkline).decode("utf-8"),
         build_date=build_date,
         year=build_date.year,
     )
 
-    # Ensure output directory exists
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    # Write HTML
-    (OUTPUT_DIR / "index.html").write_text(html)
-
-    # Write JSON data file for handoff
+    # Write JSON data file for handoff (raw values, no display strings)
     json_data = {
         "build_date": build_date.isoformat(),
-        "companies": enriched,
+        "companies": [
+            {k: v for k, v in asdict(stock).items() if not k.endswith("_fmt")}
+            for stock in enriched
+        ],
     }
-    (OUTPUT_DIR / "top25.json").write_text(json.dumps(json_data, indent=2))
+    (output_dir / "top25.json").write_bytes(dump_json(json_data, indent=True))
 
     # Write verification log
     log_content = [
         f"Build: {build_date.strftime('%Y-%m-%d %H:%M')} UTC",
         "-" * 40,
     ] + validation_log
-    (OUTPUT_DIR / "verification.txt").write_text("\n".join(log_content))
+    (output_dir / "verification.txt").write_bytes("\n".join(log_content).encode("utf-8"))
 
-    # Copy static assets
-    static_out = OUTPUT_DIR / "static"
-    if static_out.exists():
-        shutil.rmtree(static_out)
-    shutil.copytree(STATIC_DIR, static_out)
+    # Copy static assets (only files that changed)
+    sync_tree(STATIC_DIR, output_dir / "static", clean=clean)
 
-    print(f"\nSite built -> {OUTPUT_DIR}")
-    print(f"  index.html        ({len(html):,} bytes)")
+    print(f"\nSite built -> {output_dir}")
+    print(f"  index.html        ({html_size:,} bytes)")
     print(f"  top25.json        (data handoff)")
     print(f"  verification.txt  (validation log)")
 
@@ -345,7 +274,11 @@ def render_site(enriched, gainer, loser, pe_high, pe_low,
 # ---------------------------------------------------------------------------
 
 
-def main():
+def build_site(data=None, output_dir=OUTPUT_DIR, clean=False):
+    """
+    Fetch, validate and render the Top 25 site into output_dir.
+    Pass data (a download_prices() frame) to skip the price download.
+    """
     print("=" * 50)
     print("LA Stock Watch: Top 25 — Building site")
     print("=" * 50)
@@ -354,7 +287,9 @@ def main():
     tickers = [c["ticker"] for c in companies]
 
     print(f"\nFetching market data for {len(tickers)} companies...")
-    quotes, failed_tickers = fetch_quotes(tickers)
+    quotes, failed_tickers, price_data = fetch_quotes(
+        tickers, CHANGE_WINDOW_DAYS, load_static_fundamentals(companies), data
+    )
     print(f"  Got quotes for {len(quotes)} companies")
 
     if len(quotes) < 20:
@@ -362,8 +297,10 @@ def main():
         return
 
     enriched = build_enriched_data(companies, quotes)
-    gainer, loser = find_spotlight_stocks(enriched)
-    pe_high, pe_low = compute_pe_extremes(enriched)
+    add_display_fields(enriched)
+    extremes = compute_all_extremes(enriched)
+    gainer, loser = extremes["gainer"], extremes["loser"]
+    pe_high, pe_low = extremes["pe_highest"], extremes["pe_lowest"]
 
     # Validation
     print("\nValidating data...")
@@ -375,30 +312,37 @@ def main():
         print("\nERROR: Validation failed. Build aborted.")
         return
 
-    # Fetch sparklines for spotlight stocks
+    # Sparklines for spotlight stocks (reuses the 7-day download)
     gainer_sparkline = []
     loser_sparkline = []
     if gainer:
-        print(f"\n  Fetching sparkline for {gainer['ticker']}...")
-        gainer_sparkline = fetch_historical(gainer["ticker"])
+        gainer_sparkline = sparkline_from_download(price_data, gainer.ticker)
     if loser:
-        print(f"  Fetching sparkline for {loser['ticker']}...")
-        loser_sparkline = fetch_historical(loser["ticker"])
+        loser_sparkline = sparkline_from_download(price_data, loser.ticker)
+    save_cache()
 
     build_date = datetime.now(timezone.utc)
 
     # Summary
-    print(f"\n  Top gainer: {gainer['name']} ({gainer['ticker']}) +{gainer['change_pct']}%")
-    print(f"  Top loser:  {loser['name']} ({loser['ticker']}) {loser['change_pct']}%")
-    print(f"  P/E high:   {pe_high['name']} ({pe_high['pe']:.1f}x)" if pe_high else "  P/E high: N/A")
-    print(f"  P/E low:    {pe_low['name']} ({pe_low['pe']:.1f}x)" if pe_low else "  P/E low: N/A")
+    print(f"\n  Top gainer: {gainer.name} ({gainer.ticker}) +{gainer.change_pct}%")
+    print(f"  Top loser:  {loser.name} ({loser.ticker}) {loser.change_pct}%")
+    print(f"  P/E high:   {pe_high.name} ({pe_high.pe:.1f}x)" if pe_high else "  P/E high: N/A")
+    print(f"  P/E low:    {pe_low.name} ({pe_low.pe:.1f}x)" if pe_low else "  P/E low: N/A")
 
     render_site(
         enriched, gainer, loser, pe_high, pe_low,
         gainer_sparkline, loser_sparkline,
-        build_date, validation_log
+        build_date, validation_log, clean=clean, output_dir=output_dir,
     )
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Build the LA Stock Watch: Top 25 site.")
+    parser.add_argument("--clean", action="store_true",
+                        help="recopy static assets from scratch")
+    args = parser.parse_args()
+    build_site(clean=args.clean)
+
+
 if __name__ == "__main__":
     main()
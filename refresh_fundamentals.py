@@ -0,0 +1,65 @@
+"""
+LA Stock Watch — Fundamentals Refresh
+Stores each company's shares outstanding and trailing EPS in the companies
+JSON files (shares_outstanding / trailing_eps). The build scripts multiply
+and divide them by the live price to get market cap and P/E, so they don't
+need a per-ticker Yahoo lookup on every run.
+
+Shares are implied from Yahoo's market cap (marketCap / price), which counts
+every share class; sharesOutstanding often covers only the listed class
+(e.g. SNAP, TTD, RIVN) and would understate their caps.
+
+Share counts and EPS only change with quarterly filings; this runs monthly
+via GitHub Actions. Re-run it by hand after adding a company.
+"""
+
+import json
+
+from yahoo import DATA_DIR, fetch_info_map
+
+COMPANY_FILES = [
+    DATA_DIR / "socal_companies.json",
+    DATA_DIR / "top25_companies.json",
+]
+
+
+def save_companies(path, companies):
+    """Write the companies list one object per line, like the hand-edited files."""
+    lines = ",\n".join(f"  {json.dumps(c)}" for c in companies)
+    path.write_text(f"[\n{lines}\n]\n")
+
+
+def main():
+    print("=" * 50)
+    print("LA Stock Watch — Refreshing fundamentals")
+    print("=" * 50)
+
+    company_lists = {}
+    for path in COMPANY_FILES:
+        with open(path) as f:
+            company_lists[path] = json.load(f)
+
+    tickers = sorted({c["ticker"] for companies in company_lists.values() for c in companies})
+    print(f"\nFetching shares outstanding and EPS for {len(tickers)} tickers...")
+    info_map = fetch_info_map(tickers)
+
+    failed = set()
+    for path, companies in company_lists.items():
+        for company in companies:
+            info = info_map.get(company["ticker"]) or {}
+            price = info.get("regularMarketPrice") or info.get("currentPrice")
+            if not info.get("marketCap") or not price:
+                # Keep the previous values rather than blanking them
+                failed.add(company["ticker"])
+                continue
+            company["shares_outstanding"] = round(info["marketCap"] / price)
+            company["trailing_eps"] = info.get("trailingEps")
+        save_companies(path, companies)
+        print(f"  Updated {path.name}")
+
+    if failed:
+        print(f"  WARNING: Failed to fetch: {', '.join(sorted(failed))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+LA Stock Watch — shared site helpers
+JSON output, value formatting and Jinja rendering used by both
+build.py and build_top25.py.
+"""
+
+import json
+import os
+import shutil
+from functools import lru_cache
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+PROJECT_ROOT = Path(__file__).parent
+TEMPLATE_DIR = PROJECT_ROOT / "templates"
+STATIC_DIR = PROJECT_ROOT / "static"
+JINJA_CACHE_DIR = PROJECT_ROOT / ".jinja_cache"
+
+# ---------------------------------------------------------------------------
+# JSON serialization (orjson when installed, stdlib json otherwise)
+# ---------------------------------------------------------------------------
+
+
+def dump_json(obj, indent=False):
+    """Serialize obj to UTF-8 JSON bytes, optionally indented by 2 spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Formatting helpers
+# ---------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=512)
+def get_initials(name):
+    """Get 1-2 character initials for avatar display."""
+    words = name.replace(".", "").split()
+    if len(words) >= 2:
+        return (words[0][0] + words[1][0]).upper()
+    return name[:2].upper()
+
+
+@lru_cache(maxsize=512)
+def format_market_cap(value):
+    """Format market cap as human-readable string."""
+    if not value:
+        return "N/A"
+    if value >= 1_000_000_000_000:
+        return f"${value / 1_000_000_000_000:.1f}T"
+    if value >= 1_000_000_000:
+        return f"${value / 1_000_000_000:.1f}B"
+    if value >= 1_000_000:
+        return f"${value / 1_000_000:.0f}M"
+    return f"${value:,.0f}"
+
+
+@lru_cache(maxsize=512)
+def format_price(value):
+    """Format price with 2 decimal places."""
+    if not value:
+        return "$0.00"
+    return f"${value:,.2f}"
+
+
+@lru_cache(maxsize=512)
+def format_pe(value):
+    """Format P/E ratio."""
+    if not value:
+        return "N/A"
+    return f"{value:.1f}x"
+
+
+# ---------------------------------------------------------------------------
+# Template rendering
+# ---------------------------------------------------------------------------
+
+_env = None
+
+
+def _get_env():
+    """
+    Return the shared Jinja environment, creating it on first use.
+    Compiled templates are kept in memory and their bytecode on disk,
+    so repeat renders skip parsing and compiling.
+
+    Autoescaping is off on purpose: every value rendered comes from Yahoo
+    Finance or our own company JSON files, never from user input.
+    """
+    global _env
+    if _env is None:
+        JINJA_CACHE_DIR.mkdir(exist_ok=True)
+        env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            bytecode_cache=FileSystemBytecodeCache(directory=str(JINJA_CACHE_DIR)),
+            autoescape=False,
+            optimized=True,
+            auto_reload=False,
+            cache_size=-1,
+        )
+        env.filters["initials"] = get_initials
+        _env = env
+    return _env
+
+
+def sync_tree(src, dst, clean=False):
+    """
+    Mirror src into dst, copying only files whose size or mtime changed
+    and deleting files that no longer exist in src.
+    With clean=True, dst is removed first and copied from scratch.
+    """
+    dst = Path(dst)
+    if clean and dst.exists():
+        shutil.rmtree(dst)
+    dst.mkdir(parents=True, exist_ok=True)
+
+    existing = {entry.name: entry for entry in os.scandir(dst)}
+    for entry in os.scandir(src):
+        target = dst / entry.name
+        current = existing.pop(entry.name, None)
+        if entry.is_dir():
+            if current is not None and not current.is_dir():
+                os.unlink(current.path)
+            sync_tree(entry.path, target)
+            continue
+
+        if current is not None and current.is_dir():
+            shutil.rmtree(current.path)
+            current = None
+        if current is not None:
+            src_stat = entry.stat()
+            dst_stat = current.stat()
+            if (src_stat.st_mtime_ns, src_stat.st_size) == (dst_stat.st_mtime_ns, dst_stat.st_size):
+                continue
+        shutil.copy2(entry.path, target)
+
+    # Anything left was deleted from src
+    for stale in existing.values():
+        if stale.is_dir():
+            shutil.rmtree(stale.path)
+        else:
+            os.unlink(stale.path)
+
+
+def stream_template(name, path, **context):
+    """
+    Render a template straight into path, chunk by chunk, without holding
+    the whole page in memory. Returns the number of bytes written.
+    """
+    with open(path, "wb") as f:
+        _get_env().get_template(name).stream(**context).dump(f, encoding="utf-8")
+        return f.tell()
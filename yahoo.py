@@ -0,0 +1,543 @@
+"""
+LA Stock Watch — Yahoo Finance data layer
+Shared by build.py, build_top25.py, build_all.py and refresh_fundamentals.py:
+price downloads, quote/info lookups, sparkline charts, and the on-disk
+response cache they all read and write.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import aiohttp
+import pandas as pd
+import requests
+import yfinance as yf
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from site_common import dump_json
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# Cache for Yahoo responses, shared by all build scripts
+CACHE_FILE = DATA_DIR / ".yf_cache.json"
+CACHE_TTL = 600  # seconds
+
+# Parallel workers for per-ticker info lookups (8-12 avoids Yahoo rate limits)
+FETCH_WORKERS = 10
+
+# Yahoo JSON endpoints (batch quotes, per-ticker summaries, daily charts)
+YAHOO_COOKIE_URL = "https://fc.yahoo.com"
+YAHOO_CRUMB_URL = "https://query2.finance.yahoo.com/v1/test/getcrumb"
+YAHOO_QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+YAHOO_SUMMARY_URL = "https://query2.finance.yahoo.com/v10/finance/quoteSummary/{ticker}"
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
+QUOTE_BATCH_SIZE = 200
+
+# Sparkline span in calendar days (same as the chart endpoint's range=7d)
+SPARKLINE_DAYS = 7
+
+# Seconds before a failed crumb handshake is retried (stops every worker
+# thread from repeating it back to back while Yahoo is refusing)
+CRUMB_RETRY_INTERVAL = 5
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# Batch quote field -> yfinance .info field
+QUOTE_FIELDS = {
+    "regularMarketPrice": "regularMarketPrice",
+    "fiftyTwoWeekHigh": "fiftyTwoWeekHigh",
+    "fiftyTwoWeekLow": "fiftyTwoWeekLow",
+    "marketCap": "marketCap",
+    "trailingPE": "trailingPE",
+    "regularMarketVolume": "volume",
+    "epsTrailingTwelveMonths": "trailingEps",
+}
+
+# yfinance .info fields kept from the .info fallback
+INFO_FIELDS = ("currentPrice", *QUOTE_FIELDS.values())
+
+# ---------------------------------------------------------------------------
+# Yahoo response cache (avoids re-fetching across re-runs and retries)
+# ---------------------------------------------------------------------------
+
+_cache = None
+
+
+def _load_cache():
+    """Load the on-disk cache once per process."""
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def cache_get(key, ttl=CACHE_TTL):
+    """Return the cached value for key, or None if missing or expired."""
+    entry = _load_cache().get(key)
+    if entry and time.time() - entry["ts"] < ttl:
+        return entry["value"]
+    return None
+
+
+def cache_put(key, value):
+    """Store a value in the in-memory cache (persisted by save_cache)."""
+    _load_cache()[key] = {"ts": time.time(), "value": value}
+
+
+def save_cache():
+    """Write unexpired cache entries to disk atomically (temp file + rename)."""
+    if _cache is None:
+        return
+    now = time.time()
+    fresh = {k: e for k, e in _cache.items() if now - e["ts"] < CACHE_TTL}
+    # Unique temp name next to the cache file (matched by .gitignore)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_FILE.parent, prefix=CACHE_FILE.name + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dump_json(fresh))
+        os.replace(tmp_path, CACHE_FILE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def cached_info(ticker, ttl=CACHE_TTL):
+    """
+    Quote info for ticker, served from the cache when fresh.
+    Uses the quoteSummary JSON API, falling back to yfinance's .info when
+    that fails (e.g. Yahoo refused our crumb), so an endpoint or crumb
+    change degrades the build instead of emptying it.
+    """
+    info = cache_get(f"info:{ticker}", ttl)
+    if info is None:
+        session, crumb = _get_yahoo_session()
+        try:
+            info = fetch_info_fast(ticker, session, crumb)
+        except Exception:
+            info = fetch_info_yf(ticker)
+        cache_put(f"info:{ticker}", info)
+    return info
+
+
+# ---------------------------------------------------------------------------
+# Price downloads (using yfinance — free, no API key)
+# ---------------------------------------------------------------------------
+
+
+def download_prices(tickers):
+    """
+    Download a year of daily bars for all tickers in one yf.download call.
+    A year of history gives the 52-week range; the weekly change uses
+    only the most recent days of it.
+    Bars are unadjusted (with an "Adj Close" column), so High/Low match
+    Yahoo's quoted 52-week range instead of being scaled for dividends.
+    yfinance keeps its own browser-impersonating session for this call.
+    """
+    return yf.download(
+        " ".join(tickers),
+        period="1y",
+        group_by="ticker",
+        progress=False,
+        threads=True,
+        auto_adjust=False,
+    )
+
+
+def fetch_quotes(tickers, window_days, fundamentals=None, data=None):
+    """
+    Fetch quotes for all tickers using yfinance.
+    yfinance can fetch multiple tickers at once efficiently: one 1-year
+    download covers current and window-start prices (window_days calendar
+    days apart), 52-week range and volume.
+    Pass data to reuse a download_prices() frame (it may hold extra tickers).
+    fundamentals ({ticker: (shares, eps)}) gives market cap and P/E from
+    the live price; only tickers missing from it need a live info lookup.
+    Returns (quotes, failed tickers, last window_days of the download).
+    """
+    fundamentals = fundamentals or {}
+    if data is None:
+        print(f"  Downloading data for {len(tickers)} tickers...")
+        data = download_prices(tickers)
+
+    stats = summarize_download(data, tickers, window_days)
+    count = stats["count"]
+
+    # Live info is only needed for tickers without stored fundamentals
+    # or without usable price history
+    need_info = [t for t in tickers if t not in fundamentals or count.get(t, 0) < 2]
+    info_map = fetch_info_map(need_info) if need_info else {}
+
+    all_quotes = []
+    failed = []
+
+    for ticker in tickers:
+        info = info_map.get(ticker)
+        if info is None and count.get(ticker, 0) < 2:
+            # Neither the download nor a live lookup gave us a price
+            failed.append(ticker)
+            continue
+        try:
+            # Prices, 52-week range and volume from the download data
+            # (needs at least two recent closes for a week-over-week change)
+            if count.get(ticker, 0) >= 2:
+                current_price = float(stats["last"][ticker])
+                week_ago_price = float(stats["first"][ticker])
+                year_high = round(float(stats["high"][ticker]), 2)
+                year_low = round(float(stats["low"][ticker]), 2)
+                volume = stats["volume"].get(ticker)
+                if pd.isna(volume):
+                    # No volume in the download; use the quote's if we have one
+                    volume = (info or {}).get("volume", 0)
+                volume = int(volume)
+            else:
+                current_price = info.get("currentPrice") or info.get("regularMarketPrice", 0)
+                week_ago_price = None
+                year_high = info.get("fiftyTwoWeekHigh", 0)
+                year_low = info.get("fiftyTwoWeekLow", 0)
+                volume = info.get("volume", 0)
+
+            if ticker in fundamentals:
+                # Market cap and P/E move with the price; shares and EPS don't
+                shares, eps = fundamentals[ticker]
+                market_cap = round(current_price * shares)
+                pe = round(current_price / eps, 2) if eps and eps > 0 else None
+            elif info is not None:
+                market_cap, pe = info.get("marketCap", 0), info.get("trailingPE")
+            else:
+                # Lookup failed but the download had prices; shown as N/A
+                market_cap, pe = 0, None
+
+            if current_price and current_price > 0:
+                all_quotes.append({
+                    "symbol": ticker,
+                    "price": current_price,
+                    "week_ago_price": week_ago_price,
+                    "yearHigh": year_high,
+                    "yearLow": year_low,
+                    "marketCap": market_cap,
+                    "pe": pe,
+                    "volume": volume,
+                })
+        except Exception:
+            failed.append(ticker)
+
+    if failed:
+        print(f"  Warning: Failed to fetch {len(failed)} tickers: {', '.join(failed[:5])}{'...' if len(failed) > 5 else ''}")
+
+    return all_quotes, failed, recent_rows(data, window_days)
+
+
+def recent_rows(data, days):
+    """Rows of the yf.download frame within the last `days` calendar days."""
+    if data.empty:
+        return data
+    return data[data.index > data.index[-1] - pd.Timedelta(days=days)]
+
+
+def _price_field(data, field, tickers):
+    """One OHLCV field of the yf.download frame as a (date × ticker) frame."""
+    if isinstance(data.columns, pd.MultiIndex):
+        return data.xs(field, axis=1, level=1)
+    if field in data.columns:
+        # Single ticker without a ticker level
+        return data[[field]].rename(columns={field: tickers[0]})
+    return pd.DataFrame()
+
+
+def summarize_download(data, tickers, window_days):
+    """
+    Reduce the 1-year yf.download frame to per-ticker stats in one
+    vectorized pass: first/last adjusted close and close count over the
+    last window_days, plus 52-week high/low (raw) and the latest volume.
+    Returns dict of {stat: {ticker: value}}; NaNs are skipped.
+    """
+    closes = _price_field(recent_rows(data, window_days), "Adj Close", tickers)
+    if closes.empty:
+        return {stat: {} for stat in ("first", "last", "count", "high", "low", "volume")}
+    return {
+        "first": closes.bfill().iloc[0].to_dict(),
+        "last": closes.ffill().iloc[-1].to_dict(),
+        "count": closes.count().to_dict(),
+        "high": _price_field(data, "High", tickers).max().to_dict(),
+        "low": _price_field(data, "Low", tickers).min().to_dict(),
+        "volume": _price_field(data, "Volume", tickers).ffill().iloc[-1].to_dict(),
+    }
+
+
+def load_static_fundamentals(companies):
+    """
+    Shares outstanding and trailing EPS stored in the companies JSON by
+    refresh_fundamentals.py.
+    Returns dict of {ticker: (shares, eps)} for companies that have them.
+    """
+    return {
+        c["ticker"]: (c["shares_outstanding"], c.get("trailing_eps"))
+        for c in companies
+        if c.get("shares_outstanding")
+    }
+
+
+# ---------------------------------------------------------------------------
+# Quote info (Yahoo JSON endpoints)
+# ---------------------------------------------------------------------------
+
+
+def fetch_info_map(tickers):
+    """
+    Fetch info for all tickers: cached entries first, one batched quote
+    request for the rest, then parallel per-ticker quoteSummary lookups
+    for anything the batch didn't return.
+    Returns dict of {ticker: info}; tickers that failed map to None.
+    """
+    info_map = {}
+    for ticker in tickers:
+        info = cache_get(f"info:{ticker}")
+        if info is not None:
+            info_map[ticker] = info
+
+    uncached = [t for t in tickers if t not in info_map]
+    try:
+        batch = fetch_quotes_batch(uncached) if uncached else {}
+    except Exception as e:
+        print(f"  Warning: Batch quote request failed ({e}); using per-ticker info")
+        batch = {}
+    for ticker, info in batch.items():
+        cache_put(f"info:{ticker}", info)
+    info_map.update(batch)
+
+    missing = [t for t in tickers if t not in info_map]
+    if missing:
+        info_map.update(fetch_infos(missing))
+    save_cache()
+    return info_map
+
+
+_yahoo_session = None
+_yahoo_crumb = None
+_yahoo_crumb_failed_at = None
+_yahoo_session_lock = threading.Lock()
+
+
+def _yahoo_handshake(session):
+    """
+    Do the cookie/crumb handshake on session.
+    Returns the crumb, or None if Yahoo refused it (error status or empty body).
+    """
+    try:
+        # Sets the session cookie; the response itself is usually a 404
+        session.get(YAHOO_COOKIE_URL, timeout=10)
+    except requests.RequestException:
+        pass
+    try:
+        resp = session.get(YAHOO_CRUMB_URL, timeout=10)
+    except requests.RequestException:
+        return None
+    crumb = resp.text.strip()
+    if not resp.ok or not crumb:
+        # e.g. a 401/429 error page, which must not be sent as the crumb
+        return None
+    return crumb
+
+
+def _get_yahoo_session():
+    """
+    Shared requests session for our own Yahoo JSON calls (not yfinance's):
+    pooled keep-alive connections, gzip, retries with backoff, and the
+    cookie/crumb handshake done.
+    A failed handshake is retried on a later call (at most once every
+    CRUMB_RETRY_INTERVAL seconds); until then requests go out without a crumb.
+    Returns (session, crumb).
+    """
+    global _yahoo_session, _yahoo_crumb, _yahoo_crumb_failed_at
+    with _yahoo_session_lock:
+        if _yahoo_session is None:
+            session = requests.Session()
+            session.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+            })
+            retry = Retry(total=3, backoff_factor=0.3,
+                          status_forcelist=[429, 500, 502, 503, 504])
+            # One pool for every worker thread, with headroom over FETCH_WORKERS
+            session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50,
+                                                  max_retries=retry))
+            _yahoo_session = session
+
+        retry_due = (_yahoo_crumb_failed_at is None
+                     or time.monotonic() - _yahoo_crumb_failed_at >= CRUMB_RETRY_INTERVAL)
+        if _yahoo_crumb is None and retry_due:
+            _yahoo_crumb = _yahoo_handshake(_yahoo_session)
+            if _yahoo_crumb is None:
+                _yahoo_crumb_failed_at = time.monotonic()
+        return _yahoo_session, _yahoo_crumb
+
+
+def fetch_quotes_batch(tickers):
+    """
+    Fetch quote fields via Yahoo's batch quote endpoint, QUOTE_BATCH_SIZE
+    tickers per request.
+    Returns dict of {ticker: info} using yfinance .info key names.
+    """
+    session, crumb = _get_yahoo_session()
+    info_map = {}
+    for i in range(0, len(tickers), QUOTE_BATCH_SIZE):
+        chunk = tickers[i:i + QUOTE_BATCH_SIZE]
+        resp = session.get(
+            YAHOO_QUOTE_URL,
+            params={"symbols": ",".join(chunk), "crumb": crumb},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        for result in resp.json()["quoteResponse"]["result"]:
+            info_map[result["symbol"]] = {
+                info_key: result[quote_key]
+                for quote_key, info_key in QUOTE_FIELDS.items()
+                if result.get(quote_key) is not None
+            }
+    return info_map
+
+
+def fetch_info_fast(ticker, session, crumb):
+    """
+    Fetch quote fields for one ticker from Yahoo's quoteSummary JSON API
+    (instead of yfinance's .info scrape).
+    Returns an info dict using yfinance .info key names.
+    """
+    resp = session.get(
+        YAHOO_SUMMARY_URL.format(ticker=ticker),
+        params={"modules": "price,summaryDetail,defaultKeyStatistics", "crumb": crumb},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    result = resp.json()["quoteSummary"]["result"][0]
+    price = result.get("price", {})
+    detail = result.get("summaryDetail", {})
+    stats = result.get("defaultKeyStatistics", {})
+
+    def raw(module, key):
+        return (module.get(key) or {}).get("raw")
+
+    fields = {
+        "regularMarketPrice": raw(price, "regularMarketPrice"),
+        "fiftyTwoWeekHigh": raw(detail, "fiftyTwoWeekHigh"),
+        "fiftyTwoWeekLow": raw(detail, "fiftyTwoWeekLow"),
+        "marketCap": raw(price, "marketCap"),
+        "trailingPE": raw(detail, "trailingPE"),
+        "volume": raw(price, "regularMarketVolume"),
+        "trailingEps": raw(stats, "trailingEps"),
+    }
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+def fetch_info_yf(ticker):
+    """
+    Fetch quote fields for one ticker via yfinance's .info, which uses its
+    own browser-impersonating session and cookie-strategy fallback.
+    Slower than fetch_info_fast; only used when that fails.
+    """
+    info = yf.Ticker(ticker).info
+    return {k: info[k] for k in INFO_FIELDS if info.get(k) is not None}
+
+
+def fetch_infos(tickers, max_workers=FETCH_WORKERS):
+    """
+    Fetch quote info (cached) for all tickers in parallel.
+    Returns dict of {ticker: info}; tickers that failed map to None.
+    """
+    def _fetch_one(ticker):
+        try:
+            return ticker, cached_info(ticker)
+        except Exception:
+            return ticker, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(_fetch_one, tickers))
+
+
+# ---------------------------------------------------------------------------
+# Sparklines (daily closes from the download, or the chart endpoint)
+# ---------------------------------------------------------------------------
+
+
+def sparkline_from_download(data, ticker, days=SPARKLINE_DAYS):
+    """
+    Adjusted closing prices for a sparkline chart, taken from the last `days`
+    of the download fetch_quotes already made. Falls back to fetch_sparklines
+    when the download has no closes for ticker.
+    """
+    if not data.empty and ticker in data.columns.get_level_values(0):
+        closes = recent_rows(data, days)[ticker]["Adj Close"].dropna().tolist()
+        if closes:
+            return [round(float(p), 2) for p in closes]
+    return fetch_sparklines([ticker])[ticker]
+
+
+async def fetch_chart(session, ticker, period="7d"):
+    """
+    Fetch daily closing prices from Yahoo's chart endpoint as JSON.
+    Returns a list of floats (oldest → newest).
+    """
+    url = YAHOO_CHART_URL.format(ticker=ticker)
+    async with session.get(url, params={"range": period, "interval": "1d"}) as resp:
+        resp.raise_for_status()
+        payload = await resp.json()
+
+    indicators = payload["chart"]["result"][0]["indicators"]
+    # Adjusted closes match what yfinance's history() returns
+    if indicators.get("adjclose"):
+        closes = indicators["adjclose"][0]["adjclose"]
+    else:
+        closes = indicators["quote"][0]["close"]
+    return [round(c, 2) for c in closes if c is not None]
+
+
+async def _fetch_charts(tickers):
+    """Fetch charts for all tickers concurrently over one HTTP session."""
+    async with aiohttp.ClientSession(
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=30),
+    ) as session:
+        return await asyncio.gather(
+            *(fetch_chart(session, ticker) for ticker in tickers),
+            return_exceptions=True,
+        )
+
+
+def fetch_sparklines(tickers):
+    """
+    Fetch recent daily closing prices for sparkline charts, all tickers
+    concurrently. Returns dict of {ticker: [prices]} (oldest → newest);
+    tickers that failed map to an empty list.
+    """
+    sparklines = {}
+    for ticker in tickers:
+        prices = cache_get(f"history:{ticker}:7d")
+        if prices is not None:
+            sparklines[ticker] = prices
+
+    uncached = [t for t in tickers if t not in sparklines]
+    if uncached:
+        results = asyncio.run(_fetch_charts(uncached))
+        for ticker, result in zip(uncached, results):
+            if isinstance(result, Exception):
+                print(f"    Warning: Failed to fetch history for {ticker}: {result}")
+                sparklines[ticker] = []
+            else:
+                cache_put(f"history:{ticker}:7d", result)
+                sparklines[ticker] = result
+    return sparklines